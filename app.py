@@ -3,21 +3,70 @@ Schedulr - Smart Study Planner
 Flask app with mentor-set exams, adaptive student scheduling, units/topics, and tests.
 """
 
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, request, redirect, url_for, flash, g, make_response
+from flask import session as flask_session
+from werkzeug.security import generate_password_hash, check_password_hash
 import sqlite3
 import secrets
+import hmac
+import hashlib
+import re
 from datetime import datetime, timedelta
+from functools import lru_cache, wraps
+from contextlib import contextmanager
 import os
 import logging
+import threading
+import queue
+import time
+import atexit
+import stat
+from collections import defaultdict
+from itertools import groupby
+from operator import eq, itemgetter
+from cachetools import TTLCache
+from jinja2 import FileSystemBytecodeCache
 
 app = Flask(__name__)
 
 # Use environment variable for SECRET_KEY, fallback to a default for development
 app.secret_key = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
 
-# Database path: relative to this app.py file for portability across servers
+# Database path: relative to this app.py file for portability across servers.
+# DATABASE_PATH overrides it; ':memory:' gives a process-wide in-memory database (tests/CI).
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATABASE = os.path.join(BASE_DIR, 'schedulr.db')
+DATABASE = os.getenv('DATABASE_PATH', os.path.join(BASE_DIR, 'schedulr.db'))
+MEMORY_DATABASE_URI = 'file:schedulr?mode=memory&cache=shared'
+
+# Compiled templates are kept on disk (shared by the workers and reused after a restart), so a
+# template is parsed at most once per deploy. Outside debug mode Flask doesn't re-stat templates.
+# The cache files are loaded as code, so the directory must be private to this user: without
+# JINJA_CACHE_DIR, Jinja's default per-user 0700 temp directory is used.
+JINJA_CACHE_DIR = os.getenv('JINJA_CACHE_DIR')
+
+
+def private_cache_dir(path):
+    """Create path with mode 0700 if needed; refuse it unless it is a directory owned by us with mode 0700."""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) != 0o700:
+        raise RuntimeError(f'JINJA_CACHE_DIR {path!r} must be a directory owned by this user with mode 0700')
+    return path
+
+
+if JINJA_CACHE_DIR:
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(private_cache_dir(JINJA_CACHE_DIR))
+else:
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+
+
+def warm_templates():
+    """Load every template into the environment's cache so the first request doesn't compile it."""
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(name)
+
+
+warm_templates()
 
 # Configure logging for deployment monitoring
 logging.basicConfig(
@@ -26,164 +75,409 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-
-def get_db():
-    """Get database connection with row factory for dict-like access."""
-    conn = sqlite3.connect(DATABASE)
+# Users rarely change, so auth lookups are served from short-lived in-process caches.
+# Only hits are cached: a user_id/mentor_code that does not exist yet must not be remembered as missing.
+_user_cache = TTLCache(maxsize=1024, ttl=60)
+_mentor_cache = TTLCache(maxsize=1024, ttl=60)
+_user_cache_lock = threading.Lock()
+
+# Test content only changes through edit_test, which re-inserts every question with new (higher)
+# ids, so MAX(Questions.id) of a test is a version stamp that every worker process can check.
+# Cached entries are (stamp, value) and are only used while the stamp read with the test matches.
+_test_questions_cache = TTLCache(maxsize=1024, ttl=300)
+# Grading answer keys (see _load_answer_key); students tend to submit the same test in bursts
+_answer_key_cache = TTLCache(maxsize=4096, ttl=300)
+_test_cache_lock = threading.Lock()
+
+# Idle request connections kept open for reuse (per process). LIFO so the most recently used,
+# cache-warm connection is handed out first; connections beyond DB_POOL_SIZE are closed.
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 8))
+_pool = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+
+# journal_mode=WAL is stored in the database file, so it only needs setting once per process
+_wal_enabled = False
+# A shared in-memory database is discarded when its last connection closes; this one stays open
+_memory_keeper = None
+
+
+def connect_db(**kwargs):
+    """Open a new connection to DATABASE (a file path, or ':memory:' for the shared in-memory database)."""
+    global _memory_keeper
+    if DATABASE == ':memory:':
+        if _memory_keeper is None:
+            _memory_keeper = sqlite3.connect(MEMORY_DATABASE_URI, uri=True, check_same_thread=False)
+        return sqlite3.connect(MEMORY_DATABASE_URI, uri=True, **kwargs)
+    return sqlite3.connect(DATABASE, **kwargs)
+
+
+def _open_pooled_connection():
+    """Open a connection for the pool and apply the per-connection settings once."""
+    global _wal_enabled
+    # Pooled connections are handed to whichever worker thread serves the next request.
+    # sqlite3 keeps an LRU of compiled statements per connection keyed by SQL text, so with
+    # long-lived connections the SQL_* constants below are only prepared once per connection.
+    # isolation_level=None: single statements autocommit; multi-statement writes use write_transaction().
+    conn = connect_db(cached_statements=256, check_same_thread=False, isolation_level=None)
     conn.row_factory = sqlite3.Row
+    # Off by default in SQLite; the schema relies on ON DELETE CASCADE
+    conn.execute('PRAGMA foreign_keys=ON')
+    if not _wal_enabled:
+        # WAL lets readers proceed during a write and avoids the rollback-journal fsyncs
+        conn.execute('PRAGMA journal_mode=WAL')
+        _wal_enabled = True
+    # Per-connection settings: NORMAL is durable enough under WAL and halves fsyncs
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA mmap_size=268435456')
+    conn.execute('PRAGMA cache_size=-20000')
+    # Checkpoint the WAL every 1000 pages and truncate it back to 64 MB afterwards,
+    # so a burst of writes can't leave a large WAL for readers to scan
+    conn.execute('PRAGMA wal_autocheckpoint=1000')
+    conn.execute('PRAGMA journal_size_limit=67108864')
     return conn
 
 
+def get_db():
+    """
+    Get the database connection for the current request, with row factory for dict-like access.
+    Taken from the pool (or opened) on first use, reused by every helper in the same request,
+    and returned to the pool in close_db().
+    """
+    if 'db' not in g:
+        try:
+            g.db = _pool.get_nowait()
+        except queue.Empty:
+            g.db = _open_pooled_connection()
+    return g.db
+
+
+@contextmanager
+def write_transaction(conn):
+    """
+    Run a block of related writes as one BEGIN IMMEDIATE ... COMMIT transaction (ROLLBACK on error).
+    Taking the write lock up front means the block never has to upgrade a read lock mid-way.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+@app.teardown_appcontext
+def close_db(exception):
+    """Return the request's database connection (if one was taken) to the pool when the app context ends."""
+    db = g.pop('db', None)
+    if db is None:
+        return
+    # Never hand the next request a connection with a half-finished transaction
+    if db.in_transaction:
+        db.rollback()
+    try:
+        _pool.put_nowait(db)
+    except queue.Full:
+        db.close()
+
+
+# --- Background writes ---
+# Writes nothing reads back on the next page (e.g. StudySchedule history) are queued and
+# committed by one writer thread in batches, so the request can redirect without waiting on fsync.
+WRITE_BATCH_SIZE = 500
+WRITE_BATCH_INTERVAL = 0.1  # seconds to wait for more writes before committing a batch
+
+_write_queue = queue.Queue()
+_writer_thread = None
+_writer_lock = threading.Lock()
+
+
+def enqueue_write(sql, params):
+    """Queue a write statement for the background writer (started lazily in each worker process)."""
+    global _writer_thread
+    with _writer_lock:
+        if _writer_thread is None or not _writer_thread.is_alive():
+            _writer_thread = threading.Thread(target=_background_writer, name='schedulr-writer', daemon=True)
+            _writer_thread.start()
+    _write_queue.put((sql, params))
+
+
+def _background_writer():
+    """Drain the write queue: up to WRITE_BATCH_SIZE statements or WRITE_BATCH_INTERVAL per transaction."""
+    conn = connect_db()
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA foreign_keys=ON')
+    while True:
+        batch = [_write_queue.get()]
+        deadline = time.monotonic() + WRITE_BATCH_INTERVAL
+        while len(batch) < WRITE_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_write_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        try:
+            with conn:
+                # Consecutive statements with the same SQL go through one executemany()
+                for sql, group in groupby(batch, key=itemgetter(0)):
+                    conn.executemany(sql, [params for _, params in group])
+        except sqlite3.Error:
+            # Retry one by one so a single bad statement doesn't drop the rest of the batch
+            for sql, params in batch:
+                try:
+                    with conn:
+                        conn.execute(sql, params)
+                except sqlite3.Error:
+                    logger.exception('Background write failed: %s', sql)
+        finally:
+            for _ in batch:
+                _write_queue.task_done()
+
+
+@atexit.register
+def _flush_writes():
+    """Wait for queued writes to be committed before the process exits."""
+    if _writer_thread is not None and _writer_thread.is_alive():
+        _write_queue.join()
+
+
+# Full schema; init_db() runs it with a single executescript() call
+SCHEMA_SQL = """
+-- Deleting a StudyUnit cascades to its Tests (-> Questions -> Options), Exams, StudentProgress
+-- and StudySchedule rows; needs PRAGMA foreign_keys=ON, which every connection sets.
+
+-- Drop existing tables in reverse dependency order
+DROP TABLE IF EXISTS StudySchedule;
+DROP TABLE IF EXISTS Exams;
+DROP TABLE IF EXISTS StudentProgress;
+DROP TABLE IF EXISTS Options;
+DROP TABLE IF EXISTS Questions;
+DROP TABLE IF EXISTS Tests;
+DROP TABLE IF EXISTS StudyUnits;
+DROP TABLE IF EXISTS StudySessions;
+DROP TABLE IF EXISTS Users;
+
+-- Users: role, username, password; mentor_code (mentors only); mentor_id (students only, FK to mentor)
+CREATE TABLE Users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT UNIQUE NOT NULL,
+    password TEXT NOT NULL,
+    role TEXT NOT NULL CHECK(role IN ('student', 'mentor')),
+    mentor_code TEXT UNIQUE,
+    mentor_id INTEGER,
+    FOREIGN KEY (mentor_id) REFERENCES Users(id)
+);
+
+-- StudySessions: student_id links to Users (students)
+CREATE TABLE StudySessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    student_id INTEGER NOT NULL,
+    subject TEXT NOT NULL,
+    start_time TEXT NOT NULL,
+    notes TEXT,
+    completed INTEGER DEFAULT 0,
+    FOREIGN KEY (student_id) REFERENCES Users(id)
+);
+
+-- StudyUnits: mentor-controlled units/topics per subject
+CREATE TABLE StudyUnits (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    mentor_id INTEGER NOT NULL,
+    subject TEXT NOT NULL,
+    unit_name TEXT NOT NULL,
+    topic_name TEXT NOT NULL,
+    FOREIGN KEY (mentor_id) REFERENCES Users(id)
+);
+
+-- Tests: mentor-created tests for each unit (test_title only; questions in separate tables)
+CREATE TABLE Tests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    mentor_id INTEGER NOT NULL,
+    unit_id INTEGER NOT NULL,
+    test_title TEXT NOT NULL DEFAULT 'Test',
+    FOREIGN KEY (mentor_id) REFERENCES Users(id),
+    FOREIGN KEY (unit_id) REFERENCES StudyUnits(id) ON DELETE CASCADE
+);
+
+-- Questions: linked to Tests, type MCQ or ShortAnswer
+CREATE TABLE Questions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    test_id INTEGER NOT NULL,
+    question_text TEXT NOT NULL,
+    type TEXT NOT NULL CHECK(type IN ('MCQ', 'ShortAnswer')),
+    correct_answer TEXT,
+    FOREIGN KEY (test_id) REFERENCES Tests(id) ON DELETE CASCADE
+);
+
+-- Options: for MCQ questions only; is_correct 1 = correct answer
+CREATE TABLE Options (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    question_id INTEGER NOT NULL,
+    option_text TEXT NOT NULL,
+    is_correct INTEGER DEFAULT 0,
+    FOREIGN KEY (question_id) REFERENCES Questions(id) ON DELETE CASCADE
+);
+
+-- StudentProgress: tracks completion, test results, difficulty_level per student per unit
+-- difficulty_level: 'easy' (>70%), 'medium' (50-70%), 'hard' (<50%) - derived from test_score
+CREATE TABLE StudentProgress (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    student_id INTEGER NOT NULL,
+    unit_id INTEGER NOT NULL,
+    completed INTEGER DEFAULT 0,
+    test_taken INTEGER DEFAULT 0,
+    test_score REAL,
+    difficulty_level TEXT,
+    FOREIGN KEY (student_id) REFERENCES Users(id),
+    FOREIGN KEY (unit_id) REFERENCES StudyUnits(id) ON DELETE CASCADE,
+    UNIQUE(student_id, unit_id)
+);
+
+-- Exams: mentor-assigned exam dates per unit (students cannot edit)
+CREATE TABLE Exams (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    mentor_id INTEGER NOT NULL,
+    subject TEXT NOT NULL,
+    unit_id INTEGER NOT NULL,
+    exam_date TEXT NOT NULL,
+    FOREIGN KEY (mentor_id) REFERENCES Users(id),
+    FOREIGN KEY (unit_id) REFERENCES StudyUnits(id) ON DELETE CASCADE,
+    UNIQUE(unit_id)
+);
+
+-- StudySchedule: adaptive suggested study sessions (generated per student)
+CREATE TABLE StudySchedule (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    student_id INTEGER NOT NULL,
+    unit_id INTEGER NOT NULL,
+    suggested_study_time TEXT NOT NULL,
+    completed INTEGER DEFAULT 0,
+    FOREIGN KEY (student_id) REFERENCES Users(id),
+    FOREIGN KEY (unit_id) REFERENCES StudyUnits(id) ON DELETE CASCADE
+);
+"""
+
+
 def init_db():
     """
-    Initialize database schema if not already initialized.
-    Tables: Users, StudySessions, StudyUnits, Tests, StudentProgress.
-    Safely checks if tables exist before recreating - supports fresh deployments.
+    Initialize database schema if not already initialized, and bring existing databases up to date
+    (cascading foreign keys, indexes, change tracking). Runs when the module is imported, so every
+    entry point (python app.py, gunicorn, uWSGI) is migrated before it serves a request.
+    The check and every change happen in one BEGIN IMMEDIATE transaction: when several workers
+    start together, the first does the work and the others wait, then find nothing left to do.
     """
-    # Check if database already has tables
-    conn = sqlite3.connect(DATABASE)
+    conn = connect_db(isolation_level=None, timeout=60)
     cursor = conn.cursor()
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-    tables_exist = cursor.fetchone() is not None
-    
-    if tables_exist:
-        logger.info('Database already initialized. Skipping schema creation.')
+    # Tables are rebuilt by migrate_cascades() with enforcement off (it can't change mid-transaction)
+    cursor.execute('PRAGMA foreign_keys=OFF')
+    try:
+        with write_transaction(conn):
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+            tables_exist = cursor.fetchone() is not None
+
+            if tables_exist:
+                logger.info('Database already initialized. Skipping schema creation.')
+                migrate_cascades(cursor)
+            else:
+                logger.info('Initializing database schema...')
+                for statement in _split_sql(SCHEMA_SQL):
+                    cursor.execute(statement)
+            create_indexes(cursor)
+            create_change_tracking(cursor)
+    finally:
         conn.close()
+    if not tables_exist:
+        logger.info('Database schema created successfully.')
+
+
+def _split_sql(script):
+    """Split an SQL script into single statements (executescript() would commit the open transaction)."""
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement
+            statement = ''
+
+
+# Tables whose unit/test/question foreign keys are declared ON DELETE CASCADE in SCHEMA_SQL
+CASCADE_TABLES = ('Tests', 'Questions', 'Options', 'StudentProgress', 'Exams', 'StudySchedule')
+
+
+def migrate_cascades(cursor):
+    """
+    Rebuild CASCADE_TABLES in databases created before their foreign keys had ON DELETE CASCADE.
+    SQLite can't alter a foreign key in place, so each stale table is recreated from SCHEMA_SQL and
+    its rows copied across (create new, copy, drop old, rename). Indexes and triggers on the rebuilt
+    tables are restored by create_indexes() and create_change_tracking(), which init_db runs next.
+    Runs inside init_db's transaction, with foreign key enforcement off.
+    """
+    definitions = dict(re.findall(r'^CREATE TABLE (\w+) (\(.*?^\));', SCHEMA_SQL, re.M | re.S))
+    stale = [row[0] for row in cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ({}) AND sql NOT LIKE '%ON DELETE CASCADE%'"
+        .format(', '.join('?' * len(CASCADE_TABLES))), CASCADE_TABLES)]
+    if not stale:
         return
-    
-    logger.info('Initializing database schema...')
-
-    # Drop existing tables in reverse dependency order
-    cursor.execute('DROP TABLE IF EXISTS StudySchedule')
-    cursor.execute('DROP TABLE IF EXISTS Exams')
-    cursor.execute('DROP TABLE IF EXISTS StudentProgress')
-    cursor.execute('DROP TABLE IF EXISTS Options')
-    cursor.execute('DROP TABLE IF EXISTS Questions')
-    cursor.execute('DROP TABLE IF EXISTS Tests')
-    cursor.execute('DROP TABLE IF EXISTS StudyUnits')
-    cursor.execute('DROP TABLE IF EXISTS StudySessions')
-    cursor.execute('DROP TABLE IF EXISTS Users')
-
-    # Users: role, username, password; mentor_code (mentors only); mentor_id (students only, FK to mentor)
-    cursor.execute('''
-        CREATE TABLE Users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            role TEXT NOT NULL CHECK(role IN ('student', 'mentor')),
-            mentor_code TEXT UNIQUE,
-            mentor_id INTEGER,
-            FOREIGN KEY (mentor_id) REFERENCES Users(id)
-        )
-    ''')
-
-    # StudySessions: student_id links to Users (students)
-    cursor.execute('''
-        CREATE TABLE StudySessions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            student_id INTEGER NOT NULL,
-            subject TEXT NOT NULL,
-            start_time TEXT NOT NULL,
-            notes TEXT,
-            completed INTEGER DEFAULT 0,
-            FOREIGN KEY (student_id) REFERENCES Users(id)
-        )
-    ''')
-
-    # StudyUnits: mentor-controlled units/topics per subject
-    cursor.execute('''
-        CREATE TABLE StudyUnits (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            mentor_id INTEGER NOT NULL,
-            subject TEXT NOT NULL,
-            unit_name TEXT NOT NULL,
-            topic_name TEXT NOT NULL,
-            FOREIGN KEY (mentor_id) REFERENCES Users(id)
-        )
-    ''')
-
-    # Tests: mentor-created tests for each unit (test_title only; questions in separate tables)
-    cursor.execute('''
-        CREATE TABLE Tests (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            mentor_id INTEGER NOT NULL,
-            unit_id INTEGER NOT NULL,
-            test_title TEXT NOT NULL DEFAULT 'Test',
-            FOREIGN KEY (mentor_id) REFERENCES Users(id),
-            FOREIGN KEY (unit_id) REFERENCES StudyUnits(id)
-        )
-    ''')
-
-    # Questions: linked to Tests, type MCQ or ShortAnswer
-    cursor.execute('''
-        CREATE TABLE Questions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            test_id INTEGER NOT NULL,
-            question_text TEXT NOT NULL,
-            type TEXT NOT NULL CHECK(type IN ('MCQ', 'ShortAnswer')),
-            correct_answer TEXT,
-            FOREIGN KEY (test_id) REFERENCES Tests(id)
-        )
-    ''')
-
-    # Options: for MCQ questions only; is_correct 1 = correct answer
-    cursor.execute('''
-        CREATE TABLE Options (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            question_id INTEGER NOT NULL,
-            option_text TEXT NOT NULL,
-            is_correct INTEGER DEFAULT 0,
-            FOREIGN KEY (question_id) REFERENCES Questions(id)
-        )
-    ''')
-
-    # StudentProgress: tracks completion, test results, difficulty_level per student per unit
-    # difficulty_level: 'easy' (>70%), 'medium' (50-70%), 'hard' (<50%) - derived from test_score
-    cursor.execute('''
-        CREATE TABLE StudentProgress (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            student_id INTEGER NOT NULL,
-            unit_id INTEGER NOT NULL,
-            completed INTEGER DEFAULT 0,
-            test_taken INTEGER DEFAULT 0,
-            test_score REAL,
-            difficulty_level TEXT,
-            FOREIGN KEY (student_id) REFERENCES Users(id),
-            FOREIGN KEY (unit_id) REFERENCES StudyUnits(id),
-            UNIQUE(student_id, unit_id)
-        )
-    ''')
-
-    # Exams: mentor-assigned exam dates per unit (students cannot edit)
-    cursor.execute('''
-        CREATE TABLE Exams (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            mentor_id INTEGER NOT NULL,
-            subject TEXT NOT NULL,
-            unit_id INTEGER NOT NULL,
-            exam_date TEXT NOT NULL,
-            FOREIGN KEY (mentor_id) REFERENCES Users(id),
-            FOREIGN KEY (unit_id) REFERENCES StudyUnits(id),
-            UNIQUE(unit_id)
-        )
-    ''')
-
-    # StudySchedule: adaptive suggested study sessions (generated per student)
-    cursor.execute('''
-        CREATE TABLE StudySchedule (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            student_id INTEGER NOT NULL,
-            unit_id INTEGER NOT NULL,
-            suggested_study_time TEXT NOT NULL,
-            completed INTEGER DEFAULT 0,
-            FOREIGN KEY (student_id) REFERENCES Users(id),
-            FOREIGN KEY (unit_id) REFERENCES StudyUnits(id)
-        )
-    ''')
+    logger.info('Adding ON DELETE CASCADE to: %s', ', '.join(stale))
+    for table in stale:
+        columns = ', '.join(row[1] for row in cursor.execute(f'PRAGMA table_info({table})'))
+        cursor.execute(f'CREATE TABLE {table}_new {definitions[table]}')
+        cursor.execute(f'INSERT INTO {table}_new ({columns}) SELECT {columns} FROM {table}')
+        cursor.execute(f'DROP TABLE {table}')
+        cursor.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
 
-    conn.commit()
-    conn.close()
-    logger.info('Database schema created successfully.')
+
+def create_indexes(cursor):
+    """
+    Create indexes on the foreign-key/lookup columns used by the dashboards, schedule, tests and
+    ON DELETE CASCADE. Uses IF NOT EXISTS so it also upgrades databases created before the indexes
+    existed, then refreshes the planner statistics with ANALYZE.
+    Users.username, Users.mentor_code, Exams(unit_id) and StudentProgress(student_id, unit_id) are
+    UNIQUE and therefore already indexed; StudyUnits lookups by id go through the primary key.
+    """
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_student ON StudySessions(student_id, start_time)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_units_mentor ON StudyUnits(mentor_id, subject, unit_name)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_progress_student ON StudentProgress(student_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_exams_mentor ON Exams(mentor_id, exam_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tests_mentor_unit ON Tests(mentor_id, unit_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_mentorid ON Users(mentor_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tests_unit ON Tests(unit_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_questions_test ON Questions(test_id, id)')
+    # Covers both the option listing and the is_correct = 1 answer-key join
+    cursor.execute('DROP INDEX IF EXISTS idx_options_qid')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_options_question ON Options(question_id, is_correct)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_progress_unit ON StudentProgress(unit_id)')
+    # One schedule row per student and unit, so completions can UPSERT. Older databases may hold
+    # duplicates from the previous UPDATE-or-INSERT writes; keep the newest before adding the index.
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'uq_schedule_student_unit'")
+    if cursor.fetchone() is None:
+        cursor.execute('DELETE FROM StudySchedule WHERE id NOT IN '
+                       '(SELECT MAX(id) FROM StudySchedule GROUP BY student_id, unit_id)')
+        cursor.execute('DROP INDEX IF EXISTS idx_schedule_student_unit')
+        cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS uq_schedule_student_unit ON StudySchedule(student_id, unit_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_schedule_unit ON StudySchedule(unit_id)')
+    cursor.execute('ANALYZE')
+
+
+# Tables whose contents appear on the dashboards; any write to them bumps DataVersion.version
+TRACKED_TABLES = ('Users', 'StudySessions', 'StudyUnits', 'Tests', 'Questions', 'Options', 'StudentProgress', 'Exams')
+
+
+def create_change_tracking(cursor):
+    """
+    Create the single-row DataVersion table and the triggers that bump it on every write to
+    TRACKED_TABLES. The dashboards use the version in their ETag. Idempotent (IF NOT EXISTS).
+    """
+    cursor.execute('CREATE TABLE IF NOT EXISTS DataVersion (version INTEGER NOT NULL)')
+    cursor.execute('INSERT INTO DataVersion (version) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM DataVersion)')
+    for table in TRACKED_TABLES:
+        for op in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{op.lower()}_version AFTER {op} ON {table}
+                BEGIN UPDATE DataVersion SET version = version + 1; END
+            ''')
 
 
 def generate_mentor_code():
@@ -191,110 +485,277 @@ def generate_mentor_code():
     return secrets.token_hex(4)
 
 
+# --- SQL for hot paths ---
+# Auth and dashboard statements, defined once so every call reuses the same string (and the
+# connection's statement cache). Columns are limited to what the handlers and templates read.
+
+USER_COLUMNS = 'id, username, role, mentor_code, mentor_id'
+SQL_AUTH = 'SELECT id, role, password FROM Users WHERE username = ?'
+SQL_GET_USER = f'SELECT {USER_COLUMNS} FROM Users WHERE id = ?'
+SQL_GET_MENTOR_BY_CODE = f"SELECT {USER_COLUMNS} FROM Users WHERE role = 'mentor' AND mentor_code = ?"
+
+# Columns for one schedule row: unit, the student's progress (sp), the unit's exam date (e) and its priority
+SCHEDULE_COLUMNS = '''
+    u.id, u.subject, u.unit_name, u.topic_name,
+    sp.id AS progress_id, sp.completed, sp.test_taken, sp.test_score, sp.difficulty_level,
+    e.exam_date,
+    CASE
+        WHEN sp.completed IS NULL OR sp.completed = 0
+            THEN (CASE WHEN e.exam_date IS NOT NULL THEN 10 ELSE 5 END)
+        WHEN sp.test_taken IS NULL OR sp.test_taken = 0
+            THEN (CASE WHEN e.exam_date IS NOT NULL THEN 9 ELSE 4 END)
+        WHEN sp.test_score < 70
+            THEN (CASE WHEN e.exam_date IS NOT NULL THEN 8 ELSE 3 END)
+        ELSE 1
+    END AS priority
+'''
+SCHEDULE_ORDER = 'priority DESC, e.exam_date IS NULL, e.exam_date, u.subject, u.unit_name'
+
+# All units assigned by mentor, with this student's progress, the unit's exam date and its schedule priority
+SQL_SCHEDULE_ROWS = f'''
+    SELECT {SCHEDULE_COLUMNS}
+    FROM StudyUnits u
+    LEFT JOIN StudentProgress sp ON sp.unit_id = u.id AND sp.student_id = ?
+    LEFT JOIN Exams e ON e.unit_id = u.id
+    WHERE u.mentor_id = ?
+    ORDER BY {SCHEDULE_ORDER}
+'''
+
+SQL_STUDENT_SESSIONS = '''
+    SELECT id, subject, start_time, notes, completed
+    FROM StudySessions WHERE student_id = ? ORDER BY start_time ASC
+'''
+
+# Units assigned by mentor; one test per unit (LEFT JOIN)
+SQL_STUDENT_UNITS = '''
+    SELECT u.id, u.subject, u.unit_name, u.topic_name, t.id as test_id
+    FROM StudyUnits u
+    LEFT JOIN Tests t ON t.unit_id = u.id
+    WHERE u.mentor_id = ?
+    ORDER BY u.subject, u.unit_name
+'''
+
+SQL_UPCOMING_EXAMS = '''
+    SELECT e.exam_date, e.subject, su.unit_name, su.topic_name, su.id as unit_id
+    FROM Exams e
+    JOIN StudyUnits su ON e.unit_id = su.id
+    WHERE e.mentor_id = ? AND e.exam_date >= date('now')
+    ORDER BY e.exam_date ASC
+'''
+
+SQL_MENTOR_SESSIONS = '''
+    SELECT s.id, s.subject, s.start_time, s.notes, s.completed,
+           u.username as student_name, u.id as student_id
+    FROM StudySessions s
+    JOIN Users u ON s.student_id = u.id
+    WHERE u.mentor_id = ?
+    ORDER BY s.start_time ASC
+'''
+
+# Completed/pending session counts in a single pass
+SQL_MENTOR_SESSION_COUNTS = '''
+    SELECT SUM(CASE WHEN s.completed = 1 THEN 1 ELSE 0 END) AS completed,
+           SUM(CASE WHEN s.completed = 0 THEN 1 ELSE 0 END) AS pending
+    FROM StudySessions s
+    JOIN Users u ON s.student_id = u.id
+    WHERE u.mentor_id = ?
+'''
+
+SQL_MENTOR_UNITS = 'SELECT id, subject, unit_name, topic_name FROM StudyUnits WHERE mentor_id = ? ORDER BY subject, unit_name'
+SQL_MENTOR_TESTS = 'SELECT id, unit_id, test_title FROM Tests WHERE mentor_id = ?'
+SQL_MENTOR_EXAMS = 'SELECT unit_id, exam_date FROM Exams WHERE mentor_id = ?'
+
+# Progress for all linked students (with unit names, difficulty_level)
+SQL_MENTOR_PROGRESS = '''
+    SELECT sp.completed, sp.test_taken, sp.test_score, sp.difficulty_level,
+           u.username as student_name, su.subject, su.unit_name, su.topic_name
+    FROM StudentProgress sp
+    JOIN Users u ON sp.student_id = u.id
+    JOIN StudyUnits su ON sp.unit_id = su.id
+    WHERE u.mentor_id = ?
+'''
+
+# Test builder / grading statements (hot on take_test, submit_test, add/edit/delete test and unit)
+
+# Questions of a test with their options in one pass (one row per option; ShortAnswer rows have NULL option columns)
+SQL_TEST_QUESTIONS_WITH_OPTIONS = '''
+    SELECT q.id, q.question_text, q.type, q.correct_answer,
+           o.id AS opt_id, o.option_text, o.is_correct
+    FROM Questions q
+    LEFT JOIN Options o ON o.question_id = q.id AND q.type = 'MCQ'
+    WHERE q.test_id = ?
+    ORDER BY q.id, o.id
+'''
+# Answer key for grading: one row per question with its correct option id (NULL for ShortAnswer)
+SQL_TEST_ANSWER_KEY = '''
+    SELECT q.id AS qid, q.type, q.correct_answer, o.id AS opt_id
+    FROM Questions q
+    LEFT JOIN Options o ON o.question_id = q.id AND o.is_correct = 1
+    WHERE q.test_id = ?
+    ORDER BY q.id, o.id
+'''
+SQL_INSERT_QUESTION = 'INSERT INTO Questions (test_id, question_text, type, correct_answer) VALUES (?, ?, ?, ?)'
+SQL_INSERT_OPTION = 'INSERT INTO Options (question_id, option_text, is_correct) VALUES (?, ?, ?)'
+SQL_TEST_QUESTION_IDS = 'SELECT id FROM Questions WHERE test_id = ? ORDER BY id'
+
+# Student writes: one UPSERT each on the (student_id, unit_id) unique keys. StudySchedule's key is
+# the uq_schedule_student_unit index, which init_db() adds to older databases at import time.
+SQL_UPSERT_SCHEDULE_COMPLETE = '''
+    INSERT INTO StudySchedule (student_id, unit_id, suggested_study_time, completed) VALUES (?, ?, ?, 1)
+    ON CONFLICT(student_id, unit_id) DO UPDATE SET completed = 1, suggested_study_time = excluded.suggested_study_time
+'''
+SQL_UPSERT_UNIT_COMPLETE = '''
+    INSERT INTO StudentProgress (student_id, unit_id, completed, test_taken, test_score) VALUES (?, ?, 1, 0, NULL)
+    ON CONFLICT(student_id, unit_id) DO UPDATE SET completed = 1
+'''
+# difficulty_level from the score: hard (<50%), medium (50-70%), easy (>=70%)
+SQL_UPSERT_TEST_RESULT = '''
+    INSERT INTO StudentProgress (student_id, unit_id, completed, test_taken, test_score, difficulty_level)
+    VALUES (:student_id, :unit_id, 1, 1, :score,
+            CASE WHEN :score < 50 THEN 'hard' WHEN :score < 70 THEN 'medium' ELSE 'easy' END)
+    ON CONFLICT(student_id, unit_id) DO UPDATE SET
+        test_taken = 1, test_score = excluded.test_score, difficulty_level = excluded.difficulty_level
+'''
+# Options cascade from their question
+SQL_DELETE_TEST_QUESTIONS = 'DELETE FROM Questions WHERE test_id = ?'
+
+
+# Prefixes of hashes produced by werkzeug's generate_password_hash(); anything else is a legacy plaintext password
+PASSWORD_HASH_PREFIXES = ('scrypt:', 'pbkdf2:')
+
+
 def authenticate_user(username, password):
-    """Authenticate user by username and password. Returns user row or None."""
+    """
+    Authenticate user by username and password. Returns user row or None.
+    Looks the user up by the UNIQUE username only and verifies the password hash in Python.
+    Accounts created before passwords were hashed are compared in constant time and
+    re-saved with a hash on their first successful login.
+    """
     conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM Users WHERE username = ? AND password = ?', (username, password))
-    user = cursor.fetchone()
-    conn.close()
+    user = conn.execute(SQL_AUTH, (username,)).fetchone()
+    if user is None:
+        return None
+    stored = user['password']
+    if stored.startswith(PASSWORD_HASH_PREFIXES):
+        return user if check_password_hash(stored, password) else None
+    if not hmac.compare_digest(stored.encode(), password.encode()):
+        return None
+    conn.execute('UPDATE Users SET password = ? WHERE id = ?', (generate_password_hash(password), user['id']))
+    conn.commit()
     return user
 
 
 def get_user_by_id(user_id):
-    """Get user by ID. Returns user row or None."""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM Users WHERE id = ?', (user_id,))
-    user = cursor.fetchone()
-    conn.close()
+    """
+    Get user by ID. Returns user dict or None.
+    Memoized on g for the rest of the request (misses included) and cached per process for up to 60s.
+    """
+    key = str(user_id)
+    request_users = g.setdefault('users', {})
+    if key in request_users:
+        return request_users[key]
+    with _user_cache_lock:
+        user = _user_cache.get(key)
+    if user is None:
+        row = get_db().execute(SQL_GET_USER, (user_id,)).fetchone()
+        if row is not None:
+            user = dict(row)
+            with _user_cache_lock:
+                _user_cache[key] = user
+    request_users[key] = user
     return user
 
 
+def forget_user(user_id):
+    """Drop a user from the request and process caches so the next lookup reads the database."""
+    key = str(user_id)
+    g.get('users', {}).pop(key, None)
+    with _user_cache_lock:
+        _user_cache.pop(key, None)
+
+
 def get_mentor_by_code(mentor_code):
-    """Look up mentor by their unique code. Returns mentor row or None."""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM Users WHERE role = 'mentor' AND mentor_code = ?", (mentor_code,))
-    mentor = cursor.fetchone()
-    conn.close()
+    """Look up mentor by their unique code (cached for up to 60s). Returns mentor dict or None."""
+    with _user_cache_lock:
+        mentor = _mentor_cache.get(mentor_code)
+    if mentor is not None:
+        return mentor
+    row = get_db().execute(SQL_GET_MENTOR_BY_CODE, (mentor_code,)).fetchone()
+    if row is None:
+        return None
+    mentor = dict(row)
+    with _user_cache_lock:
+        _mentor_cache[mentor_code] = mentor
     return mentor
 
 
-def generate_adaptive_schedule(student_id, mentor_id):
+@lru_cache(maxsize=1024)
+def _parse_exam_date(exam_date):
+    """Parse a stored exam date ('YYYY-MM-DD' or 'YYYY-MM-DDTHH:MM'); shared by every student's schedule."""
+    return datetime.fromisoformat(exam_date.replace('T', ' '))
+
+
+def _load_schedule_rows(student_id, mentor_id):
+    """
+    All units assigned by mentor, with this student's progress and the unit's exam date (one round-trip).
+    SQLite computes each unit's priority and returns the rows already in schedule order:
+    priority descending, then nearest exam first.
+    """
+    return get_db().execute(SQL_SCHEDULE_ROWS, (student_id, mentor_id)).fetchall()
+
+
+def generate_adaptive_schedule(student_id, mentor_id, rows=None):
     """
     Generate suggested study sessions for a student based on:
     - Topics not completed (highest priority)
     - Topics where student struggled or failed (test_score < 70)
     - Upcoming exam dates (prioritize units with exams soon)
+    Callers that already loaded _load_schedule_rows() can pass them in as rows.
     Returns list of {unit, suggested_study_time, reason, exam_date} ordered by priority.
     """
-    conn = get_db()
-    cursor = conn.cursor()
-
-    # All units assigned by mentor
-    cursor.execute('''
-        SELECT u.id, u.subject, u.unit_name, u.topic_name
-        FROM StudyUnits u
-        WHERE u.mentor_id = ?
-        ORDER BY u.subject, u.unit_name
-    ''', (mentor_id,))
-    units = [dict(row) for row in cursor.fetchall()]
-
-    # Progress for this student
-    cursor.execute('''
-        SELECT unit_id, completed, test_taken, test_score, difficulty_level
-        FROM StudentProgress WHERE student_id = ?
-    ''', (student_id,))
-    progress = {row['unit_id']: dict(row) for row in cursor.fetchall()}
-
-    # Exam dates: unit_id -> exam_date
-    cursor.execute('SELECT unit_id, exam_date FROM Exams WHERE mentor_id = ?', (mentor_id,))
-    exams = {row['unit_id']: row['exam_date'] for row in cursor.fetchall()}
-
-    conn.close()
+    if rows is None:
+        rows = _load_schedule_rows(student_id, mentor_id)
 
     now = datetime.now()
+    # Only three distinct slots are ever suggested, so format them once per call
+    slot_urgent = (now + timedelta(hours=2)).strftime('%Y-%m-%dT%H:00')
+    slot_next_day = (now + timedelta(days=1)).strftime('%Y-%m-%dT09:00')
+    slot_later = (now + timedelta(days=2)).strftime('%Y-%m-%dT09:00')
     suggestions = []
 
-    for u in units:
+    # Rows arrive sorted by priority from SQL, so suggestions keep that order
+    for u in rows:
         uid = u['id']
-        prog = progress.get(uid, {})
-        completed = prog.get('completed', 0)
-        test_taken = prog.get('test_taken', 0)
-        score = prog.get('test_score')
-        difficulty = prog.get('difficulty_level')
-        exam_date = exams.get(uid)
+        completed = u['completed'] or 0
+        test_taken = u['test_taken'] or 0
+        score = u['test_score']
+        exam_date = u['exam_date']
+        priority = u['priority']
 
         # Compute suggested study time: base slot, earlier if exam is soon
         if exam_date:
             try:
-                ed = datetime.fromisoformat(exam_date.replace('T', ' '))
-                days_until = (ed - now).days
+                days_until = (_parse_exam_date(exam_date) - now).days
                 if days_until <= 3:
-                    suggested_time = (now + timedelta(hours=2)).strftime('%Y-%m-%dT%H:00')
+                    suggested_time = slot_urgent
                 elif days_until <= 7:
-                    suggested_time = (now + timedelta(days=1)).strftime('%Y-%m-%dT09:00')
+                    suggested_time = slot_next_day
                 else:
-                    suggested_time = (now + timedelta(days=2)).strftime('%Y-%m-%dT09:00')
+                    suggested_time = slot_later
             except (ValueError, TypeError):
-                suggested_time = (now + timedelta(days=1)).strftime('%Y-%m-%dT09:00')
+                suggested_time = slot_next_day
         else:
-            suggested_time = (now + timedelta(days=1)).strftime('%Y-%m-%dT09:00')
+            suggested_time = slot_next_day
 
-        # Priority and reason
+        # Reason (mirrors the priority CASE in _load_schedule_rows)
         if not completed:
             reason = 'Not started'
-            priority = 10 if exam_date else 5
         elif not test_taken:
             reason = 'Completed, test pending'
-            priority = 9 if exam_date else 4
         elif score is not None and score < 70:
             reason = f'Struggled (score: {score:.0f}%)'
-            priority = 8 if exam_date else 3
         else:
             reason = 'Completed'
-            priority = 1
 
         if exam_date:
             reason += f' | Exam: {exam_date[:10]}'
@@ -310,11 +771,72 @@ def generate_adaptive_schedule(student_id, mentor_id):
             'test_taken': test_taken,
         })
 
-    # Sort by priority (descending), then by exam date proximity
-    suggestions.sort(key=lambda x: (-x['priority'], x['suggested_study_time']))
     return suggestions
 
 
+# --- Conditional GET for dashboards ---
+
+def dashboard_etag(user_id, *parts):
+    """
+    ETag for a dashboard: changes whenever any tracked table is written (DataVersion) or any of
+    parts changes (e.g. the clock hour for time-dependent content). None if change tracking
+    has not been created yet (database initialized by an older version).
+    """
+    try:
+        version = get_db().execute('SELECT version FROM DataVersion').fetchone()[0]
+    except sqlite3.OperationalError:
+        return None
+    key = '-'.join(str(p) for p in (user_id, version) + parts)
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+def not_modified_response(etag):
+    """304 response if the client's copy matches etag; None if the page has to be rendered."""
+    # Pending flash messages are only shown by a fresh render
+    if etag is None or '_flashes' in flask_session or not request.if_none_match.contains(etag):
+        return None
+    return with_etag(app.response_class(status=304), etag)
+
+
+def with_etag(response, etag):
+    """Attach etag to a dashboard response; no-cache makes the browser revalidate on every visit."""
+    response = make_response(response)
+    if etag is not None:
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    return response
+
+
+# --- Access control ---
+
+def role_required(role):
+    """
+    Decorator for routes restricted to one role. Reads user_id from the form (POST) or query string,
+    redirects to login if it is missing or not a user with that role, and otherwise calls the view
+    with the loaded user as the `user` keyword argument.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            values = request.form if request.method == 'POST' else request.args
+            user_id = values.get('user_id')
+            if not user_id:
+                flash('Please login first', 'error')
+                return redirect(url_for('login'))
+            user = get_user_by_id(user_id)
+            if not user or user['role'] != role:
+                flash('Access denied', 'error')
+                return redirect(url_for('login'))
+            return view(user=user, **kwargs)
+        return wrapper
+    return decorator
+
+
+mentor_required = role_required('mentor')
+student_required = role_required('student')
+
+
 # --- Routes ---
 
 @app.route('/')
@@ -339,6 +861,8 @@ def login():
 
         user = authenticate_user(username, password)
         if user:
+            # A new session starts from the stored user row rather than a cached copy
+            forget_user(user['id'])
             if user['role'] == 'student':
                 return redirect(url_for('student_dashboard', user_id=user['id']))
             elif user['role'] == 'mentor':
@@ -391,21 +915,19 @@ def signup():
         conn = get_db()
         cursor = conn.cursor()
 
-        # Check username uniqueness
-        cursor.execute('SELECT id FROM Users WHERE username = ?', (username,))
-        if cursor.fetchone():
-            conn.close()
+        # Insert new user; the UNIQUE constraint on username rejects duplicates atomically
+        try:
+            cursor.execute('''
+                INSERT INTO Users (username, password, role, mentor_code, mentor_id)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (username, generate_password_hash(password), role, new_mentor_code, mentor_id))
+        except sqlite3.IntegrityError as e:
+            if 'Users.username' not in str(e):
+                raise
             flash('Username already exists', 'error')
             return render_template('signup.html')
-
-        # Insert new user
-        cursor.execute('''
-            INSERT INTO Users (username, password, role, mentor_code, mentor_id)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (username, password, role, new_mentor_code, mentor_id))
         conn.commit()
         new_id = cursor.lastrowid
-        conn.close()
 
         flash('Account created successfully!', 'success')
         if role == 'mentor':
@@ -417,163 +939,101 @@ def signup():
 
 
 @app.route('/student_dashboard')
-def student_dashboard():
+@student_required
+def student_dashboard(user):
     """
     Student dashboard. Shows sessions, assigned units/topics from mentor, progress, and tests.
     Students can view units, mark complete, and take tests.
     """
-    user_id = request.args.get('user_id')
-    if not user_id:
-        flash('Please login first', 'error')
-        return redirect(url_for('login'))
-
-    user = get_user_by_id(user_id)
-    if not user or user['role'] != 'student':
-        flash('Access denied', 'error')
-        return redirect(url_for('login'))
+    user_id = user['id']
 
     mentor_id = user['mentor_id']
     if not mentor_id:
         return render_template('student_dashboard.html', user=user, sessions=[], units=[],
                               progress_map={}, upcoming_exams=[], suggested_schedule=[])
+
+    # Suggested times and upcoming exams depend on the clock, so the hour is part of the ETag
+    etag = dashboard_etag(user_id, datetime.now().strftime('%Y-%m-%dT%H'))
+    not_modified = not_modified_response(etag)
+    if not_modified:
+        return not_modified
+
     conn = get_db()
-    cursor = conn.cursor()
 
-    cursor.execute('''
-        SELECT * FROM StudySessions WHERE student_id = ? ORDER BY start_time ASC
-    ''', (user_id,))
-    sessions = cursor.fetchall()
+    sessions = conn.execute(SQL_STUDENT_SESSIONS, (user_id,)).fetchall()
 
-    # Units assigned by mentor; one test per unit (LEFT JOIN)
-    cursor.execute('''
-        SELECT u.id, u.subject, u.unit_name, u.topic_name, u.mentor_id,
-               t.id as test_id, t.test_title
-        FROM StudyUnits u
-        LEFT JOIN Tests t ON t.unit_id = u.id
-        WHERE u.mentor_id = ?
-        ORDER BY u.subject, u.unit_name
-    ''', (mentor_id,))
-    units = cursor.fetchall()
-
-    # Progress for this student: unit_id -> {completed, test_taken, test_score, difficulty_level}
-    cursor.execute('''
-        SELECT unit_id, completed, test_taken, test_score, difficulty_level FROM StudentProgress WHERE student_id = ?
-    ''', (user_id,))
-    progress_map = {row['unit_id']: row for row in cursor.fetchall()}
+    # Units assigned by mentor; one test per unit
+    units = conn.execute(SQL_STUDENT_UNITS, (mentor_id,)).fetchall()
 
-    # Upcoming exams (units linked to mentor)
-    cursor.execute('''
-        SELECT e.exam_date, e.subject, su.unit_name, su.topic_name, su.id as unit_id
-        FROM Exams e
-        JOIN StudyUnits su ON e.unit_id = su.id
-        WHERE e.mentor_id = ? AND e.exam_date >= date('now')
-        ORDER BY e.exam_date ASC
-    ''', (mentor_id,))
-    upcoming_exams = cursor.fetchall()
+    # Units with this student's progress and exam dates, in suggested-schedule order.
+    # Also provides progress for this student: unit_id -> {completed, test_taken, test_score, difficulty_level}
+    schedule_rows = _load_schedule_rows(user_id, mentor_id)
+    progress_map = {row['id']: row for row in schedule_rows if row['progress_id'] is not None}
 
-    conn.close()
+    # Upcoming exams (units linked to mentor)
+    upcoming_exams = conn.execute(SQL_UPCOMING_EXAMS, (mentor_id,)).fetchall()
 
     # Generate adaptive suggested study schedule (based on completion, test scores, exams)
-    suggested_schedule = generate_adaptive_schedule(user_id, mentor_id)
+    # from the rows already loaded above, so it does not query them again
+    suggested_schedule = generate_adaptive_schedule(user_id, mentor_id, rows=schedule_rows)
 
-    return render_template('student_dashboard.html', user=user, sessions=sessions,
-                          units=units, progress_map=progress_map,
-                          upcoming_exams=upcoming_exams,
-                          suggested_schedule=suggested_schedule)
+    return with_etag(render_template('student_dashboard.html', user=user, sessions=sessions,
+                                     units=units, progress_map=progress_map,
+                                     upcoming_exams=upcoming_exams,
+                                     suggested_schedule=suggested_schedule), etag)
 
 
 @app.route('/mentor_dashboard')
-def mentor_dashboard():
+@mentor_required
+def mentor_dashboard(user):
     """
     Mentor dashboard. Shows sessions, units/topics, tests, and students' progress/test results.
     Mentors manage curriculum; students interact with it.
     """
-    user_id = request.args.get('user_id')
-    if not user_id:
-        flash('Please login first', 'error')
-        return redirect(url_for('login'))
+    user_id = user['id']
 
-    user = get_user_by_id(user_id)
-    if not user or user['role'] != 'mentor':
-        flash('Access denied', 'error')
-        return redirect(url_for('login'))
+    etag = dashboard_etag(user_id)
+    not_modified = not_modified_response(etag)
+    if not_modified:
+        return not_modified
 
     conn = get_db()
-    cursor = conn.cursor()
     # Sessions for students linked to this mentor
-    cursor.execute('''
-        SELECT s.id, s.subject, s.start_time, s.notes, s.completed,
-               u.username as student_name, u.id as student_id
-        FROM StudySessions s
-        JOIN Users u ON s.student_id = u.id
-        WHERE u.mentor_id = ?
-        ORDER BY s.start_time ASC
-    ''', (user_id,))
-    sessions = cursor.fetchall()
+    sessions = conn.execute(SQL_MENTOR_SESSIONS, (user_id,)).fetchall()
 
-    cursor.execute('''
-        SELECT COUNT(*) FROM StudySessions s
-        JOIN Users u ON s.student_id = u.id
-        WHERE u.mentor_id = ? AND s.completed = 1
-    ''', (user_id,))
-    completed_count = cursor.fetchone()[0]
-
-    cursor.execute('''
-        SELECT COUNT(*) FROM StudySessions s
-        JOIN Users u ON s.student_id = u.id
-        WHERE u.mentor_id = ? AND s.completed = 0
-    ''', (user_id,))
-    pending_count = cursor.fetchone()[0]
+    # Completed/pending session counts in a single pass
+    row = conn.execute(SQL_MENTOR_SESSION_COUNTS, (user_id,)).fetchone()
+    completed_count = row['completed'] or 0
+    pending_count = row['pending'] or 0
 
     # Units/topics created by this mentor
-    cursor.execute('''
-        SELECT * FROM StudyUnits WHERE mentor_id = ? ORDER BY subject, unit_name
-    ''', (user_id,))
-    units = cursor.fetchall()
+    units = conn.execute(SQL_MENTOR_UNITS, (user_id,)).fetchall()
 
     # Tests: unit_id -> test row
-    cursor.execute('SELECT * FROM Tests WHERE mentor_id = ?', (user_id,))
-    tests_by_unit = {row['unit_id']: row for row in cursor.fetchall()}
+    tests_by_unit = {row['unit_id']: row for row in conn.execute(SQL_MENTOR_TESTS, (user_id,))}
 
     # Exams: unit_id -> exam row
-    cursor.execute('SELECT * FROM Exams WHERE mentor_id = ?', (user_id,))
-    exams_by_unit = {row['unit_id']: row for row in cursor.fetchall()}
+    exams_by_unit = {row['unit_id']: row for row in conn.execute(SQL_MENTOR_EXAMS, (user_id,))}
 
     # Progress for all linked students (with unit names, difficulty_level)
-    cursor.execute('''
-        SELECT sp.*, u.username as student_name, su.subject, su.unit_name, su.topic_name
-        FROM StudentProgress sp
-        JOIN Users u ON sp.student_id = u.id
-        JOIN StudyUnits su ON sp.unit_id = su.id
-        WHERE u.mentor_id = ?
-    ''', (user_id,))
-    progress_list = cursor.fetchall()
-
-    conn.close()
-
-    return render_template('mentor_dashboard.html',
-                          user=user,
-                          sessions=sessions,
-                          completed_count=completed_count,
-                          pending_count=pending_count,
-                          units=units,
-                          tests_by_unit=tests_by_unit,
-                          exams_by_unit=exams_by_unit,
-                          progress_list=progress_list)
+    progress_list = conn.execute(SQL_MENTOR_PROGRESS, (user_id,)).fetchall()
+
+    return with_etag(render_template('mentor_dashboard.html',
+                                     user=user,
+                                     sessions=sessions,
+                                     completed_count=completed_count,
+                                     pending_count=pending_count,
+                                     units=units,
+                                     tests_by_unit=tests_by_unit,
+                                     exams_by_unit=exams_by_unit,
+                                     progress_list=progress_list), etag)
 
 
 @app.route('/add_session', methods=['POST'])
-def add_session():
+@student_required
+def add_session(user):
     """Add a new study session (students only)."""
-    user_id = request.form.get('user_id')
-    if not user_id:
-        flash('Please login first', 'error')
-        return redirect(url_for('login'))
-
-    user = get_user_by_id(user_id)
-    if not user or user['role'] != 'student':
-        flash('Access denied', 'error')
-        return redirect(url_for('login'))
+    user_id = user['id']
 
     subject = request.form.get('subject', '').strip()
     start_time = request.form.get('start_time', '').strip()
@@ -590,38 +1050,27 @@ def add_session():
         return redirect(url_for('student_dashboard', user_id=user_id))
 
     conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''
+    conn.execute('''
         INSERT INTO StudySessions (student_id, subject, start_time, notes, completed)
         VALUES (?, ?, ?, ?, ?)
     ''', (user_id, subject, start_time, notes, 0))
     conn.commit()
-    conn.close()
 
     flash('Study session added successfully', 'success')
     return redirect(url_for('student_dashboard', user_id=user_id))
 
 
 @app.route('/edit_session/<int:session_id>', methods=['POST'])
-def edit_session(session_id):
+@student_required
+def edit_session(user, session_id):
     """Edit an existing study session (students only)."""
-    user_id = request.form.get('user_id')
-    if not user_id:
-        flash('Please login first', 'error')
-        return redirect(url_for('login'))
-
-    user = get_user_by_id(user_id)
-    if not user or user['role'] != 'student':
-        flash('Access denied', 'error')
-        return redirect(url_for('login'))
+    user_id = user['id']
 
     conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM StudySessions WHERE id = ? AND student_id = ?', (session_id, user_id))
-    session = cursor.fetchone()
+    session = conn.execute('SELECT 1 FROM StudySessions WHERE id = ? AND student_id = ?',
+                           (session_id, user_id)).fetchone()
 
     if not session:
-        conn.close()
         flash('Session not found or access denied', 'error')
         return redirect(url_for('student_dashboard', user_id=user_id))
 
@@ -630,89 +1079,65 @@ def edit_session(session_id):
     notes = request.form.get('notes', '').strip()
 
     if not subject or not start_time:
-        conn.close()
         flash('Subject and start time are required', 'error')
         return redirect(url_for('student_dashboard', user_id=user_id))
 
     try:
         datetime.fromisoformat(start_time.replace('T', ' '))
     except ValueError:
-        conn.close()
         flash('Invalid date/time format', 'error')
         return redirect(url_for('student_dashboard', user_id=user_id))
 
-    cursor.execute('''
+    conn.execute('''
         UPDATE StudySessions
         SET subject = ?, start_time = ?, notes = ?
         WHERE id = ? AND student_id = ?
     ''', (subject, start_time, notes, session_id, user_id))
     conn.commit()
-    conn.close()
 
     flash('Study session updated successfully', 'success')
     return redirect(url_for('student_dashboard', user_id=user_id))
 
 
 @app.route('/delete_session/<int:session_id>', methods=['POST'])
-def delete_session(session_id):
+@student_required
+def delete_session(user, session_id):
     """Delete a study session (students only)."""
-    user_id = request.form.get('user_id')
-    if not user_id:
-        flash('Please login first', 'error')
-        return redirect(url_for('login'))
-
-    user = get_user_by_id(user_id)
-    if not user or user['role'] != 'student':
-        flash('Access denied', 'error')
-        return redirect(url_for('login'))
+    user_id = user['id']
 
     conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM StudySessions WHERE id = ? AND student_id = ?', (session_id, user_id))
-    if not cursor.fetchone():
-        conn.close()
+    if not conn.execute('SELECT 1 FROM StudySessions WHERE id = ? AND student_id = ?', (session_id, user_id)).fetchone():
         flash('Session not found or access denied', 'error')
         return redirect(url_for('student_dashboard', user_id=user_id))
 
-    cursor.execute('DELETE FROM StudySessions WHERE id = ? AND student_id = ?', (session_id, user_id))
+    conn.execute('DELETE FROM StudySessions WHERE id = ? AND student_id = ?', (session_id, user_id))
     conn.commit()
-    conn.close()
 
     flash('Study session deleted successfully', 'success')
     return redirect(url_for('student_dashboard', user_id=user_id))
 
 
 @app.route('/mark_completed/<int:session_id>', methods=['POST'])
-def mark_completed(session_id):
+@student_required
+def mark_completed(user, session_id):
     """Toggle completion status of a study session (students only)."""
-    user_id = request.form.get('user_id')
-    if not user_id:
-        flash('Please login first', 'error')
-        return redirect(url_for('login'))
-
-    user = get_user_by_id(user_id)
-    if not user or user['role'] != 'student':
-        flash('Access denied', 'error')
-        return redirect(url_for('login'))
+    user_id = user['id']
 
     conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM StudySessions WHERE id = ? AND student_id = ?', (session_id, user_id))
-    session = cursor.fetchone()
+    session = conn.execute('SELECT completed FROM StudySessions WHERE id = ? AND student_id = ?',
+                           (session_id, user_id)).fetchone()
 
     if not session:
-        conn.close()
         flash('Session not found or access denied', 'error')
         return redirect(url_for('student_dashboard', user_id=user_id))
 
     new_status = 1 if session['completed'] == 0 else 0
-    cursor.execute('''
+    conn.execute('''
         UPDATE StudySessions
         SET completed = ?
         WHERE id = ? AND student_id = ?
     ''', (new_status, session_id, user_id))
     conn.commit()
-    conn.close()
 
     status_text = 'completed' if new_status == 1 else 'marked as pending'
     flash(f'Study session {status_text}', 'success')
@@ -722,16 +1147,10 @@ def mark_completed(session_id):
 # --- Study Units (Mentor) ---
 
 @app.route('/add_unit', methods=['POST'])
-def add_unit():
+@mentor_required
+def add_unit(user):
     """Add a new study unit/topic (mentors only)."""
-    user_id = request.form.get('user_id')
-    if not user_id:
-        flash('Please login first', 'error')
-        return redirect(url_for('login'))
-    user = get_user_by_id(user_id)
-    if not user or user['role'] != 'mentor':
-        flash('Access denied', 'error')
-        return redirect(url_for('login'))
+    user_id = user['id']
 
     subject = request.form.get('subject', '').strip()
     unit_name = request.form.get('unit_name', '').strip()
@@ -747,28 +1166,20 @@ def add_unit():
         VALUES (?, ?, ?, ?)
     ''', (user_id, subject, unit_name, topic_name))
     conn.commit()
-    conn.close()
     flash('Unit added successfully', 'success')
     return redirect(url_for('mentor_dashboard', user_id=user_id))
 
 
 @app.route('/edit_unit/<int:unit_id>', methods=['POST'])
-def edit_unit(unit_id):
+@mentor_required
+def edit_unit(user, unit_id):
     """Edit a study unit (mentors only)."""
-    user_id = request.form.get('user_id')
-    if not user_id:
-        flash('Please login first', 'error')
-        return redirect(url_for('login'))
-    user = get_user_by_id(user_id)
-    if not user or user['role'] != 'mentor':
-        flash('Access denied', 'error')
-        return redirect(url_for('login'))
+    user_id = user['id']
 
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM StudyUnits WHERE id = ? AND mentor_id = ?', (unit_id, user_id))
+    cursor.execute('SELECT 1 FROM StudyUnits WHERE id = ? AND mentor_id = ?', (unit_id, user_id))
     if not cursor.fetchone():
-        conn.close()
         flash('Unit not found', 'error')
         return redirect(url_for('mentor_dashboard', user_id=user_id))
 
@@ -776,7 +1187,6 @@ def edit_unit(unit_id):
     unit_name = request.form.get('unit_name', '').strip()
     topic_name = request.form.get('topic_name', '').strip()
     if not subject or not unit_name or not topic_name:
-        conn.close()
         flash('Subject, unit name, and topic name are required', 'error')
         return redirect(url_for('mentor_dashboard', user_id=user_id))
 
@@ -785,28 +1195,20 @@ def edit_unit(unit_id):
         WHERE id = ? AND mentor_id = ?
     ''', (subject, unit_name, topic_name, unit_id, user_id))
     conn.commit()
-    conn.close()
     flash('Unit updated successfully', 'success')
     return redirect(url_for('mentor_dashboard', user_id=user_id))
 
 
 @app.route('/edit_unit_page/<int:unit_id>')
-def edit_unit_page(unit_id):
+@mentor_required
+def edit_unit_page(user, unit_id):
     """Show edit form for a unit (mentors only)."""
-    user_id = request.args.get('user_id')
-    if not user_id:
-        flash('Please login first', 'error')
-        return redirect(url_for('login'))
-    user = get_user_by_id(user_id)
-    if not user or user['role'] != 'mentor':
-        flash('Access denied', 'error')
-        return redirect(url_for('login'))
+    user_id = user['id']
 
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM StudyUnits WHERE id = ? AND mentor_id = ?', (unit_id, user_id))
+    cursor.execute('SELECT id, subject, unit_name, topic_name FROM StudyUnits WHERE id = ? AND mentor_id = ?', (unit_id, user_id))
     unit = cursor.fetchone()
-    conn.close()
     if not unit:
         flash('Unit not found', 'error')
         return redirect(url_for('mentor_dashboard', user_id=user_id))
@@ -814,16 +1216,10 @@ def edit_unit_page(unit_id):
 
 
 @app.route('/set_exam/<int:unit_id>', methods=['POST'])
-def set_exam(unit_id):
+@mentor_required
+def set_exam(user, unit_id):
     """Set or update exam date for a unit (mentors only). Students cannot edit."""
-    user_id = request.form.get('user_id')
-    if not user_id:
-        flash('Please login first', 'error')
-        return redirect(url_for('login'))
-    user = get_user_by_id(user_id)
-    if not user or user['role'] != 'mentor':
-        flash('Access denied', 'error')
-        return redirect(url_for('login'))
+    user_id = user['id']
 
     exam_date = request.form.get('exam_date', '').strip()
     if not exam_date:
@@ -841,74 +1237,52 @@ def set_exam(unit_id):
     cursor.execute('SELECT subject FROM StudyUnits WHERE id = ? AND mentor_id = ?', (unit_id, user_id))
     unit = cursor.fetchone()
     if not unit:
-        conn.close()
         flash('Unit not found', 'error')
         return redirect(url_for('mentor_dashboard', user_id=user_id))
     subject = unit['subject']
 
-    cursor.execute('SELECT id FROM Exams WHERE unit_id = ?', (unit_id,))
-    if cursor.fetchone():
-        cursor.execute('UPDATE Exams SET exam_date = ?, subject = ? WHERE unit_id = ? AND mentor_id = ?',
-                       (exam_date, subject, unit_id, user_id))
-    else:
-        cursor.execute('INSERT INTO Exams (mentor_id, subject, unit_id, exam_date) VALUES (?, ?, ?, ?)',
-                       (user_id, subject, unit_id, exam_date))
+    cursor.execute('''
+        INSERT INTO Exams (mentor_id, subject, unit_id, exam_date) VALUES (?, ?, ?, ?)
+        ON CONFLICT(unit_id) DO UPDATE SET exam_date = excluded.exam_date, subject = excluded.subject
+        WHERE Exams.mentor_id = excluded.mentor_id
+    ''', (user_id, subject, unit_id, exam_date))
     conn.commit()
-    conn.close()
     flash('Exam date saved', 'success')
     return redirect(url_for('mentor_dashboard', user_id=user_id))
 
 
 @app.route('/delete_exam/<int:unit_id>', methods=['POST'])
-def delete_exam(unit_id):
+@mentor_required
+def delete_exam(user, unit_id):
     """Delete exam date for a unit (mentors only)."""
-    user_id = request.form.get('user_id')
-    if not user_id:
-        flash('Please login first', 'error')
-        return redirect(url_for('login'))
-    user = get_user_by_id(user_id)
-    if not user or user['role'] != 'mentor':
-        flash('Access denied', 'error')
-        return redirect(url_for('login'))
+    user_id = user['id']
 
     conn = get_db()
     cursor = conn.cursor()
     cursor.execute('DELETE FROM Exams WHERE unit_id = ? AND mentor_id = ?', (unit_id, user_id))
     conn.commit()
-    conn.close()
     flash('Exam date removed', 'success')
     return redirect(url_for('mentor_dashboard', user_id=user_id))
 
 
 @app.route('/delete_unit/<int:unit_id>', methods=['POST'])
-def delete_unit(unit_id):
-    """Delete a study unit (mentors only). Cascades: delete tests first."""
-    user_id = request.form.get('user_id')
-    if not user_id:
-        flash('Please login first', 'error')
-        return redirect(url_for('login'))
-    user = get_user_by_id(user_id)
-    if not user or user['role'] != 'mentor':
-        flash('Access denied', 'error')
-        return redirect(url_for('login'))
+@mentor_required
+def delete_unit(user, unit_id):
+    """Delete a study unit (mentors only). Its tests, exam, progress and schedule rows cascade."""
+    user_id = user['id']
 
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM StudyUnits WHERE id = ? AND mentor_id = ?', (unit_id, user_id))
-    if not cursor.fetchone():
-        conn.close()
-        flash('Unit not found', 'error')
-        return redirect(url_for('mentor_dashboard', user_id=user_id))
-
-    cursor.execute('DELETE FROM Exams WHERE unit_id = ?', (unit_id,))
-    cursor.execute('DELETE FROM StudySchedule WHERE unit_id = ?', (unit_id,))
-    cursor.execute('DELETE FROM Options WHERE question_id IN (SELECT id FROM Questions WHERE test_id IN (SELECT id FROM Tests WHERE unit_id = ?))', (unit_id,))
-    cursor.execute('DELETE FROM Questions WHERE test_id IN (SELECT id FROM Tests WHERE unit_id = ?)', (unit_id,))
-    cursor.execute('DELETE FROM Tests WHERE unit_id = ?', (unit_id,))
-    cursor.execute('DELETE FROM StudentProgress WHERE unit_id = ?', (unit_id,))
-    cursor.execute('DELETE FROM StudyUnits WHERE id = ? AND mentor_id = ?', (unit_id, user_id))
-    conn.commit()
-    conn.close()
+    with write_transaction(conn):
+        cursor.execute('SELECT 1 FROM StudyUnits WHERE id = ? AND mentor_id = ?', (unit_id, user_id))
+        if not cursor.fetchone():
+            flash('Unit not found', 'error')
+            return redirect(url_for('mentor_dashboard', user_id=user_id))
+
+        test_ids = [row[0] for row in cursor.execute('SELECT id FROM Tests WHERE unit_id = ?', (unit_id,))]
+        # Exams, StudySchedule, StudentProgress and Tests (with their Questions/Options) cascade
+        cursor.execute('DELETE FROM StudyUnits WHERE id = ? AND mentor_id = ?', (unit_id, user_id))
+    forget_tests(test_ids)
     flash('Unit deleted successfully', 'success')
     return redirect(url_for('mentor_dashboard', user_id=user_id))
 
@@ -917,22 +1291,15 @@ def delete_unit(unit_id):
 
 
 @app.route('/add_test_page/<int:unit_id>')
-def add_test_page(unit_id):
+@mentor_required
+def add_test_page(user, unit_id):
     """Show add test form for a unit (mentors only)."""
-    user_id = request.args.get('user_id')
-    if not user_id:
-        flash('Please login first', 'error')
-        return redirect(url_for('login'))
-    user = get_user_by_id(user_id)
-    if not user or user['role'] != 'mentor':
-        flash('Access denied', 'error')
-        return redirect(url_for('login'))
+    user_id = user['id']
 
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM StudyUnits WHERE id = ? AND mentor_id = ?', (unit_id, user_id))
+    cursor.execute('SELECT id, subject, unit_name, topic_name FROM StudyUnits WHERE id = ? AND mentor_id = ?', (unit_id, user_id))
     unit = cursor.fetchone()
-    conn.close()
     if not unit:
         flash('Unit not found', 'error')
         return redirect(url_for('mentor_dashboard', user_id=user_id))
@@ -940,42 +1307,96 @@ def add_test_page(unit_id):
 
 
 @app.route('/edit_test_page/<int:test_id>')
-def edit_test_page(test_id):
+@mentor_required
+def edit_test_page(user, test_id):
     """Show edit form for a test (mentors only)."""
-    user_id = request.args.get('user_id')
-    if not user_id:
-        flash('Please login first', 'error')
-        return redirect(url_for('login'))
-    user = get_user_by_id(user_id)
-    if not user or user['role'] != 'mentor':
-        flash('Access denied', 'error')
-        return redirect(url_for('login'))
+    user_id = user['id']
 
     conn = get_db()
     cursor = conn.cursor()
     cursor.execute('''
-        SELECT t.*, u.subject, u.unit_name, u.topic_name
+        SELECT t.id, t.test_title, u.subject, u.unit_name, u.topic_name,
+               (SELECT MAX(id) FROM Questions WHERE test_id = t.id) AS questions_stamp
         FROM Tests t
         JOIN StudyUnits u ON t.unit_id = u.id
         WHERE t.id = ? AND t.mentor_id = ?
     ''', (test_id, user_id))
     test = cursor.fetchone()
     if not test:
-        conn.close()
         flash('Test not found', 'error')
         return redirect(url_for('mentor_dashboard', user_id=user_id))
-    cursor.execute('SELECT * FROM Questions WHERE test_id = ? ORDER BY id', (test_id,))
-    questions = [dict(row) for row in cursor.fetchall()]
-    for q in questions:
-        if q['type'] == 'MCQ':
-            cursor.execute('SELECT * FROM Options WHERE question_id = ? ORDER BY id', (q['id'],))
-            q['options'] = [dict(row) for row in cursor.fetchall()]
-        else:
-            q['options'] = []
-    conn.close()
+    questions = _get_test_questions(conn, test_id, test['questions_stamp'])
     return render_template('edit_test.html', user=user, test=test, questions=questions)
 
 
+def _load_test_questions(conn, test_id):
+    """Questions of a test in order, each with an 'options' list (empty for ShortAnswer)."""
+    questions = []
+    for qid, rows in groupby(conn.execute(SQL_TEST_QUESTIONS_WITH_OPTIONS, (test_id,)), key=itemgetter('id')):
+        first = next(rows)
+        q = {'id': qid, 'question_text': first['question_text'], 'type': first['type'],
+             'correct_answer': first['correct_answer'], 'options': []}
+        for row in (first, *rows):
+            if row['opt_id'] is not None:
+                q['options'].append({'id': row['opt_id'], 'option_text': row['option_text'],
+                                     'is_correct': row['is_correct']})
+        questions.append(q)
+    return questions
+
+
+# Per-question fields of the test builder form: question_<i>_<field> and question_<i>_option_<j>
+TEST_FORM_KEY_RE = re.compile(r'question_(\d+)_(?:(text|type|correct|answer)|option_(\d+))')
+
+
+def _load_answer_key(conn, test_id):
+    """
+    Answer key of a test as two parallel tuples: the form field of each question ('q<id>') and the
+    normalized answer that scores it - the correct option id (as a string) for MCQ, the stripped
+    lower-cased correct_answer for ShortAnswer, or None when an MCQ has no correct option.
+    Submitted answers are compared after .strip().lower().
+    """
+    answer_key = {}
+    for row in conn.execute(SQL_TEST_ANSWER_KEY, (test_id,)):
+        qid = row['qid']
+        if qid in answer_key:
+            continue  # first correct option per question wins
+        if row['type'] == 'MCQ':
+            answer_key[qid] = str(row['opt_id']) if row['opt_id'] else None
+        else:
+            answer_key[qid] = (row['correct_answer'] or '').strip().lower()
+    return tuple(f'q{qid}' for qid in answer_key), tuple(answer_key.values())
+
+
+def _stamped_lookup(cache, test_id, stamp, load):
+    """Value cached for test_id if it was stored under the same questions_stamp, else load() and cache it."""
+    with _test_cache_lock:
+        cached = cache.get(test_id)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    value = load()
+    with _test_cache_lock:
+        cache[test_id] = (stamp, value)
+    return value
+
+
+def _get_test_questions(conn, test_id, stamp):
+    """_load_test_questions() served from the per-process cache while the test's questions_stamp is unchanged."""
+    return _stamped_lookup(_test_questions_cache, test_id, stamp, lambda: _load_test_questions(conn, test_id))
+
+
+def _get_answer_key(conn, test_id, stamp):
+    """_load_answer_key() served from the per-process cache while the test's questions_stamp is unchanged."""
+    return _stamped_lookup(_answer_key_cache, test_id, stamp, lambda: _load_answer_key(conn, test_id))
+
+
+def forget_tests(test_ids):
+    """Drop edited or deleted tests from this process's caches (other processes re-check the stamp)."""
+    with _test_cache_lock:
+        for test_id in test_ids:
+            _test_questions_cache.pop(test_id, None)
+            _answer_key_cache.pop(test_id, None)
+
+
 def _parse_test_form(request_form):
     """
     Parse form data from Google Form-style test builder.
@@ -992,33 +1413,46 @@ def _parse_test_form(request_form):
         count = 0
     if count <= 0:
         return None, None
+    # Bucket the form's question fields in one pass instead of probing for each key
+    fields = defaultdict(dict)
+    options = defaultdict(dict)
+    for key, value in request_form.items():
+        m = TEST_FORM_KEY_RE.fullmatch(key)
+        if not m:
+            continue
+        if m[3] is not None:
+            options[int(m[1])][int(m[3])] = value
+        else:
+            fields[int(m[1])][m[2]] = value
+
     questions = []
     for i in range(count):
-        text = (request_form.get(f'question_{i}_text') or '').strip()
-        qtype = (request_form.get(f'question_{i}_type') or 'MCQ').strip()
+        q_fields = fields.get(i, {})
+        text = (q_fields.get('text') or '').strip()
+        qtype = (q_fields.get('type') or 'MCQ').strip()
         if qtype not in ('MCQ', 'ShortAnswer'):
             qtype = 'MCQ'
         if not text:
             continue
         q = {'text': text, 'type': qtype}
         if qtype == 'MCQ':
+            # Options are numbered from 0; the first missing or blank one ends the list
+            q_options = options.get(i, {})
             opts = []
-            j = 0
-            while True:
-                opt = (request_form.get(f'question_{i}_option_{j}') or '').strip()
+            for j in range(len(q_options)):
+                opt = (q_options.get(j) or '').strip()
                 if not opt:
                     break
                 opts.append(opt)
-                j += 1
             if not opts:
                 continue
-            correct_idx = int(request_form.get(f'question_{i}_correct', 0) or 0)
+            correct_idx = int(q_fields.get('correct', 0) or 0)
             if correct_idx < 0 or correct_idx >= len(opts):
                 correct_idx = 0
             q['options'] = opts
             q['correct'] = correct_idx
         else:
-            ans = (request_form.get(f'question_{i}_answer') or '').strip()
+            ans = (q_fields.get('answer') or '').strip()
             q['answer'] = ans
         questions.append(q)
     if not questions:
@@ -1027,29 +1461,26 @@ def _parse_test_form(request_form):
 
 
 def _save_test_questions(cursor, test_id, questions):
-    """Save questions and options to DB for a given test_id."""
-    for q in questions:
-        cursor.execute('INSERT INTO Questions (test_id, question_text, type, correct_answer) VALUES (?, ?, ?, ?)',
-                       (test_id, q['text'], q['type'], q.get('answer')))
-        qid = cursor.lastrowid
-        if q['type'] == 'MCQ':
-            for j, opt_text in enumerate(q.get('options', [])):
-                is_correct = 1 if j == q.get('correct', 0) else 0
-                cursor.execute('INSERT INTO Options (question_id, option_text, is_correct) VALUES (?, ?, ?)',
-                               (qid, opt_text, is_correct))
+    """
+    Save questions and options to DB for a given test_id (which must have no questions yet).
+    Both tables are written with one executemany each, inside the caller's transaction.
+    """
+    cursor.executemany(SQL_INSERT_QUESTION,
+                       [(test_id, q['text'], q['type'], q.get('answer')) for q in questions])
+    # Rowids are assigned in insertion order, so the new ids line up with `questions`
+    qids = [row[0] for row in cursor.execute(SQL_TEST_QUESTION_IDS, (test_id,))]
+    cursor.executemany(SQL_INSERT_OPTION, [
+        (qid, opt_text, 1 if j == q.get('correct', 0) else 0)
+        for qid, q in zip(qids, questions) if q['type'] == 'MCQ'
+        for j, opt_text in enumerate(q.get('options', []))
+    ])
 
 
 @app.route('/add_test', methods=['POST'])
-def add_test():
+@mentor_required
+def add_test(user):
     """Add a test for a unit (mentors only). Form-based, no JSON."""
-    user_id = request.form.get('user_id')
-    if not user_id:
-        flash('Please login first', 'error')
-        return redirect(url_for('login'))
-    user = get_user_by_id(user_id)
-    if not user or user['role'] != 'mentor':
-        flash('Access denied', 'error')
-        return redirect(url_for('login'))
+    user_id = user['id']
 
     unit_id = request.form.get('unit_id')
     if not unit_id:
@@ -1063,39 +1494,30 @@ def add_test():
 
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM StudyUnits WHERE id = ? AND mentor_id = ?', (unit_id, user_id))
-    if not cursor.fetchone():
-        conn.close()
-        flash('Unit not found', 'error')
-        return redirect(url_for('mentor_dashboard', user_id=user_id))
+    with write_transaction(conn):
+        cursor.execute('SELECT 1 FROM StudyUnits WHERE id = ? AND mentor_id = ?', (unit_id, user_id))
+        if not cursor.fetchone():
+            flash('Unit not found', 'error')
+            return redirect(url_for('mentor_dashboard', user_id=user_id))
 
-    cursor.execute('SELECT id FROM Tests WHERE unit_id = ?', (unit_id,))
-    if cursor.fetchone():
-        conn.close()
-        flash('A test already exists for this unit', 'error')
-        return redirect(url_for('mentor_dashboard', user_id=user_id))
+        cursor.execute('SELECT 1 FROM Tests WHERE unit_id = ?', (unit_id,))
+        if cursor.fetchone():
+            flash('A test already exists for this unit', 'error')
+            return redirect(url_for('mentor_dashboard', user_id=user_id))
 
-    cursor.execute('INSERT INTO Tests (mentor_id, unit_id, test_title) VALUES (?, ?, ?)',
-                   (user_id, unit_id, test_title))
-    test_id = cursor.lastrowid
-    _save_test_questions(cursor, test_id, questions)
-    conn.commit()
-    conn.close()
+        cursor.execute('INSERT INTO Tests (mentor_id, unit_id, test_title) VALUES (?, ?, ?)',
+                       (user_id, unit_id, test_title))
+        test_id = cursor.lastrowid
+        _save_test_questions(cursor, test_id, questions)
     flash('Test added successfully', 'success')
     return redirect(url_for('mentor_dashboard', user_id=user_id))
 
 
 @app.route('/edit_test/<int:test_id>', methods=['POST'])
-def edit_test(test_id):
+@mentor_required
+def edit_test(user, test_id):
     """Edit a test (mentors only). Replaces all questions."""
-    user_id = request.form.get('user_id')
-    if not user_id:
-        flash('Please login first', 'error')
-        return redirect(url_for('login'))
-    user = get_user_by_id(user_id)
-    if not user or user['role'] != 'mentor':
-        flash('Access denied', 'error')
-        return redirect(url_for('login'))
+    user_id = user['id']
 
     test_title, questions = _parse_test_form(request.form)
     if not questions:
@@ -1104,47 +1526,37 @@ def edit_test(test_id):
 
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM Tests WHERE id = ? AND mentor_id = ?', (test_id, user_id))
-    if not cursor.fetchone():
-        conn.close()
-        flash('Test not found', 'error')
-        return redirect(url_for('mentor_dashboard', user_id=user_id))
-
-    cursor.execute('UPDATE Tests SET test_title = ? WHERE id = ? AND mentor_id = ?', (test_title, test_id, user_id))
-    cursor.execute('DELETE FROM Options WHERE question_id IN (SELECT id FROM Questions WHERE test_id = ?)', (test_id,))
-    cursor.execute('DELETE FROM Questions WHERE test_id = ?', (test_id,))
-    _save_test_questions(cursor, test_id, questions)
-    conn.commit()
-    conn.close()
+    with write_transaction(conn):
+        cursor.execute('SELECT 1 FROM Tests WHERE id = ? AND mentor_id = ?', (test_id, user_id))
+        if not cursor.fetchone():
+            flash('Test not found', 'error')
+            return redirect(url_for('mentor_dashboard', user_id=user_id))
+
+        cursor.execute('UPDATE Tests SET test_title = ? WHERE id = ? AND mentor_id = ?', (test_title, test_id, user_id))
+        cursor.execute(SQL_DELETE_TEST_QUESTIONS, (test_id,))
+        _save_test_questions(cursor, test_id, questions)
+    forget_tests([test_id])
     flash('Test updated successfully', 'success')
     return redirect(url_for('mentor_dashboard', user_id=user_id))
 
 
 @app.route('/delete_test/<int:test_id>', methods=['POST'])
-def delete_test(test_id):
+@mentor_required
+def delete_test(user, test_id):
     """Delete a test (mentors only)."""
-    user_id = request.form.get('user_id')
-    if not user_id:
-        flash('Please login first', 'error')
-        return redirect(url_for('login'))
-    user = get_user_by_id(user_id)
-    if not user or user['role'] != 'mentor':
-        flash('Access denied', 'error')
-        return redirect(url_for('login'))
+    user_id = user['id']
 
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM Tests WHERE id = ? AND mentor_id = ?', (test_id, user_id))
-    if not cursor.fetchone():
-        conn.close()
-        flash('Test not found', 'error')
-        return redirect(url_for('mentor_dashboard', user_id=user_id))
-
-    cursor.execute('DELETE FROM Options WHERE question_id IN (SELECT id FROM Questions WHERE test_id = ?)', (test_id,))
-    cursor.execute('DELETE FROM Questions WHERE test_id = ?', (test_id,))
-    cursor.execute('DELETE FROM Tests WHERE id = ? AND mentor_id = ?', (test_id, user_id))
-    conn.commit()
-    conn.close()
+    with write_transaction(conn):
+        cursor.execute('SELECT 1 FROM Tests WHERE id = ? AND mentor_id = ?', (test_id, user_id))
+        if not cursor.fetchone():
+            flash('Test not found', 'error')
+            return redirect(url_for('mentor_dashboard', user_id=user_id))
+
+        # Questions and their Options cascade
+        cursor.execute('DELETE FROM Tests WHERE id = ? AND mentor_id = ?', (test_id, user_id))
+    forget_tests([test_id])
     flash('Test deleted successfully', 'success')
     return redirect(url_for('mentor_dashboard', user_id=user_id))
 
@@ -1152,16 +1564,10 @@ def delete_test(test_id):
 # --- Student Progress & Tests ---
 
 @app.route('/mark_schedule_complete/<int:unit_id>', methods=['POST'])
-def mark_schedule_complete(unit_id):
+@student_required
+def mark_schedule_complete(user, unit_id):
     """Mark a suggested study session as completed (students only). Records in StudySchedule."""
-    user_id = request.form.get('user_id')
-    if not user_id:
-        flash('Please login first', 'error')
-        return redirect(url_for('login'))
-    user = get_user_by_id(user_id)
-    if not user or user['role'] != 'student':
-        flash('Access denied', 'error')
-        return redirect(url_for('login'))
+    user_id = user['id']
 
     mentor_id = user['mentor_id']
     if not mentor_id:
@@ -1170,181 +1576,102 @@ def mark_schedule_complete(unit_id):
 
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute('SELECT id FROM StudyUnits WHERE id = ? AND mentor_id = ?', (unit_id, mentor_id))
+    cursor.execute('SELECT 1 FROM StudyUnits WHERE id = ? AND mentor_id = ?', (unit_id, mentor_id))
     if not cursor.fetchone():
-        conn.close()
         flash('Unit not found', 'error')
         return redirect(url_for('student_dashboard', user_id=user_id))
 
     # Use suggested_study_time from form or default
     suggested_time = request.form.get('suggested_study_time', datetime.now().strftime('%Y-%m-%dT%H:%M'))
-    cursor.execute('SELECT id FROM StudySchedule WHERE student_id = ? AND unit_id = ?', (user_id, unit_id))
-    if cursor.fetchone():
-        cursor.execute('UPDATE StudySchedule SET completed = 1, suggested_study_time = ? WHERE student_id = ? AND unit_id = ?',
-                       (suggested_time, user_id, unit_id))
-    else:
-        cursor.execute('INSERT INTO StudySchedule (student_id, unit_id, suggested_study_time, completed) VALUES (?, ?, ?, 1)',
-                       (user_id, unit_id, suggested_time))
-    conn.commit()
-    conn.close()
+    # StudySchedule isn't read back by the dashboard, so record it off the request path
+    enqueue_write(SQL_UPSERT_SCHEDULE_COMPLETE, (user_id, unit_id, suggested_time))
     flash('Study session marked complete!', 'success')
     return redirect(url_for('student_dashboard', user_id=user_id))
 
 
 @app.route('/mark_unit_complete/<int:unit_id>', methods=['POST'])
-def mark_unit_complete(unit_id):
+@student_required
+def mark_unit_complete(user, unit_id):
     """Mark a unit as completed (students only). Creates or updates StudentProgress."""
-    user_id = request.form.get('user_id')
-    if not user_id:
-        flash('Please login first', 'error')
-        return redirect(url_for('login'))
-    user = get_user_by_id(user_id)
-    if not user or user['role'] != 'student':
-        flash('Access denied', 'error')
-        return redirect(url_for('login'))
+    user_id = user['id']
 
     mentor_id = user['mentor_id']
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM StudyUnits WHERE id = ? AND mentor_id = ?', (unit_id, mentor_id))
+    cursor.execute('SELECT 1 FROM StudyUnits WHERE id = ? AND mentor_id = ?', (unit_id, mentor_id))
     if not cursor.fetchone():
-        conn.close()
         flash('Unit not found', 'error')
         return redirect(url_for('student_dashboard', user_id=user_id))
 
-    cursor.execute('SELECT id FROM StudentProgress WHERE student_id = ? AND unit_id = ?', (user_id, unit_id))
-    if cursor.fetchone():
-        cursor.execute('UPDATE StudentProgress SET completed = 1 WHERE student_id = ? AND unit_id = ?', (user_id, unit_id))
-    else:
-        cursor.execute('''
-            INSERT INTO StudentProgress (student_id, unit_id, completed, test_taken, test_score)
-            VALUES (?, ?, 1, 0, NULL)
-        ''', (user_id, unit_id))
+    cursor.execute(SQL_UPSERT_UNIT_COMPLETE, (user_id, unit_id))
     conn.commit()
-    conn.close()
     flash('Unit marked as completed! Take the test when ready.', 'success')
     return redirect(url_for('student_dashboard', user_id=user_id))
 
 
 @app.route('/take_test/<int:test_id>')
-def take_test(test_id):
+@student_required
+def take_test(user, test_id):
     """Show test form for student to take (GET). Google Form-style display."""
-    user_id = request.args.get('user_id')
-    if not user_id:
-        flash('Please login first', 'error')
-        return redirect(url_for('login'))
-    user = get_user_by_id(user_id)
-    if not user or user['role'] != 'student':
-        flash('Access denied', 'error')
-        return redirect(url_for('login'))
+    user_id = user['id']
 
     conn = get_db()
     cursor = conn.cursor()
     cursor.execute('''
-        SELECT t.*, u.subject, u.unit_name, u.topic_name
+        SELECT t.id, t.test_title, u.subject, u.unit_name, u.topic_name,
+               (SELECT MAX(id) FROM Questions WHERE test_id = t.id) AS questions_stamp
         FROM Tests t
         JOIN StudyUnits u ON t.unit_id = u.id
         WHERE t.id = ? AND u.mentor_id = ?
     ''', (test_id, user['mentor_id']))
     test = cursor.fetchone()
     if not test:
-        conn.close()
         flash('Test not found', 'error')
         return redirect(url_for('student_dashboard', user_id=user_id))
 
-    cursor.execute('SELECT * FROM Questions WHERE test_id = ? ORDER BY id', (test_id,))
-    questions = [dict(row) for row in cursor.fetchall()]
-    for q in questions:
-        if q['type'] == 'MCQ':
-            cursor.execute('SELECT * FROM Options WHERE question_id = ? ORDER BY id', (q['id'],))
-            q['options'] = [dict(row) for row in cursor.fetchall()]
-        else:
-            q['options'] = []
-    conn.close()
+    questions = _get_test_questions(conn, test_id, test['questions_stamp'])
     return render_template('take_test.html', user=user, test=test, questions=questions)
 
 
 @app.route('/submit_test/<int:test_id>', methods=['POST'])
-def submit_test(test_id):
+@student_required
+def submit_test(user, test_id):
     """Submit test answers and store score (students only). Auto-grades using Questions/Options."""
-    user_id = request.form.get('user_id')
-    if not user_id:
-        flash('Please login first', 'error')
-        return redirect(url_for('login'))
-    user = get_user_by_id(user_id)
-    if not user or user['role'] != 'student':
-        flash('Access denied', 'error')
-        return redirect(url_for('login'))
+    user_id = user['id']
 
     conn = get_db()
     cursor = conn.cursor()
     cursor.execute('''
-        SELECT t.*, u.id as unit_id
+        SELECT t.unit_id, (SELECT MAX(id) FROM Questions WHERE test_id = t.id) AS questions_stamp
         FROM Tests t
         JOIN StudyUnits u ON t.unit_id = u.id
         WHERE t.id = ? AND u.mentor_id = ?
     ''', (test_id, user['mentor_id']))
     test = cursor.fetchone()
     if not test:
-        conn.close()
         flash('Test not found', 'error')
         return redirect(url_for('student_dashboard', user_id=user_id))
 
-    cursor.execute('SELECT * FROM Questions WHERE test_id = ? ORDER BY id', (test_id,))
-    questions = [dict(row) for row in cursor.fetchall()]
-    correct = 0
-    for q in questions:
-        qid = q['id']
-        ans = request.form.get(f'q{qid}', '').strip()
-        if q['type'] == 'MCQ':
-            cursor.execute('SELECT id FROM Options WHERE question_id = ? AND is_correct = 1 ORDER BY id LIMIT 1', (qid,))
-            row = cursor.fetchone()
-            correct_opt_id = row['id'] if row else None
-            if correct_opt_id and str(ans) == str(correct_opt_id):
-                correct += 1
-        else:
-            expected = (q.get('correct_answer') or '').strip().lower()
-            if ans.lower() == expected:
-                correct += 1
+    fields, expected = _get_answer_key(conn, test_id, test['questions_stamp'])
+    submitted = [request.form.get(field, '').strip().lower() for field in fields]
+    # Element-wise comparison of the two columns; a None expectation never matches a string
+    correct = sum(map(eq, submitted, expected))
 
-    total = len(questions)
+    total = len(fields)
     score = (correct / total * 100) if total > 0 else 0
-    unit_id = test['unit_id']
-
-    # Set difficulty_level from score: hard (<50%), medium (50-70%), easy (>70%)
-    if score < 50:
-        difficulty_level = 'hard'
-    elif score < 70:
-        difficulty_level = 'medium'
-    else:
-        difficulty_level = 'easy'
-
-    cursor.execute('SELECT id FROM StudentProgress WHERE student_id = ? AND unit_id = ?', (user_id, unit_id))
-    if cursor.fetchone():
-        cursor.execute('''
-            UPDATE StudentProgress SET test_taken = 1, test_score = ?, difficulty_level = ?
-            WHERE student_id = ? AND unit_id = ?
-        ''', (score, difficulty_level, user_id, unit_id))
-    else:
-        cursor.execute('''
-            INSERT INTO StudentProgress (student_id, unit_id, completed, test_taken, test_score, difficulty_level)
-            VALUES (?, ?, 1, 1, ?, ?)
-        ''', (user_id, unit_id, score, difficulty_level))
-    conn.commit()
-    conn.close()
+    cursor.execute(SQL_UPSERT_TEST_RESULT, {'student_id': user_id, 'unit_id': test['unit_id'], 'score': score})
 
     flash(f'Test submitted! Score: {score:.1f}%', 'success')
     return redirect(url_for('student_dashboard', user_id=user_id))
 
 
+# Create or migrate the schema before anything is served, whichever server imports the app.
+# The pooled connections enforce the ON DELETE CASCADE foreign keys and the UPSERTs need the
+# unique indexes, so a failure here must stop the worker rather than be logged and ignored.
+init_db()
+
+
 if __name__ == '__main__':
-    # Initialize database on startup (creates schema only if needed)
-    try:
-        init_db()
-        logger.info('Database initialization complete.')
-    except Exception as e:
-        logger.error(f'Failed to initialize database: {e}')
-    
     # Deployment configuration via environment variables
     host = os.getenv('FLASK_HOST', '0.0.0.0')
     port = int(os.getenv('FLASK_PORT', 5000))
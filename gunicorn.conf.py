@@ -0,0 +1,14 @@
+"""
+Gunicorn configuration for Schedulr.
+Picked up automatically when gunicorn is started from the project directory
+(e.g. `gunicorn -w 4 -b 0.0.0.0:5000 app:app`); command-line flags still take precedence.
+"""
+
+import os
+
+# Threaded workers: sqlite3 releases the GIL while a statement runs, so other requests
+# on the same worker make progress while one waits on disk. WAL mode (see get_db) lets
+# those concurrent readers run alongside a writer.
+worker_class = 'gthread'
+workers = int(os.getenv('GUNICORN_WORKERS', 4))
+threads = int(os.getenv('GUNICORN_THREADS', 8))